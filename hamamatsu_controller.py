@@ -13,24 +13,69 @@ This provides a high-level interface similar to the D3SController:
  - Periodic logging with delta_t and cumulative spectrum
 """
 
+import errno
 import os
 import time
 import threading
-from typing import Optional, Tuple
+from array import array
+from collections import deque
+from typing import Optional, TextIO, Tuple
 
 import numpy as np
 import usb.core
 import usb.util
-from struct import unpack
+from struct import Struct
+
+from hamamatsu_kernels import bin_and_accum as _bin_and_accum
+
+# Dataframe header: start marker, event count, time index, temperature ADC
+_HEADER_STRUCT = Struct(">LHxxHHxxxx")
+
+# USB errors meaning a bulk transfer was too large for the device/driver
+_TRANSFER_SIZE_ERRNOS = (errno.EOVERFLOW, errno.EINVAL, errno.ENOMEM)
+
+# Column header row for periodic log files
+_CSV_HEADER = "delta_t," + ",".join(f"ch{i}" for i in range(4096)) + "\n"
 
 
 class HamamatsuDetector:
     """Low-level interface to the Hamamatsu detector over USB."""
 
+    __slots__ = (
+        "port",
+        "uhubctl",
+        "deviceTicks",
+        "previousTimeIndex",
+        "status",
+        "verbose",
+        "virtualDevice",
+        "timeIndex",
+        "temperature",
+        "deviceTime",
+        "channels",
+        "binnedChannels",
+        "channelBinning",
+        "bootDuration",
+        "device",
+        "configuration",
+        "interface",
+        "endpoint",
+        "ep",
+        "maxPacketSize8",
+        "maxPacketSize16",
+        "data",
+        "frameData",
+        "chunkedReads",
+        "headerStart",
+        "detectorEvents",
+        "tempADC",
+        "headerData",
+    )
+
     def __init__(self, port=None, uhubctl=False, verbose: int = 1, virtual: bool = False):
         self.port = port
         self.uhubctl = uhubctl
-        self.timeOverflows = 0
+        self.deviceTicks = 0  # 16-bit time index, unwrapped
         self.previousTimeIndex = 0
         self.status = "pre init"
         self.verbose = verbose
@@ -38,8 +83,11 @@ class HamamatsuDetector:
         self.timeIndex = 0
         self.temperature = float("nan")
         self.deviceTime = 0.0
+        # frame buffers, reused for every dataframe
+        self.channels = np.zeros(1048, dtype=np.uint16)
+        self.binnedChannels = np.zeros(1048, dtype=np.uint16)
 
-        tic = time.time()
+        tic = time.monotonic()
 
         if self.virtualDevice:
             self.bootDuration = 0
@@ -68,7 +116,12 @@ class HamamatsuDetector:
         self.ep = self.endpoint
         self.maxPacketSize8 = self.ep.wMaxPacketSize
         self.maxPacketSize16 = self.ep.wMaxPacketSize // 2
-        self.bootDuration = time.time() - tic
+        # reusable packet buffer; pyusb reads into it in place
+        self.data = array("B", bytes(self.maxPacketSize8))
+        # channels 24..1047 are fetched with a single bulk transfer where possible
+        self.frameData = array("B", bytes((1048 - 24) * 2))
+        self.chunkedReads = False
+        self.bootDuration = time.monotonic() - tic
         self.status = "OK"
 
     def powerCycle(self):
@@ -140,21 +193,27 @@ class HamamatsuDetector:
     def processHeader(self) -> bool:
         """Read and parse the dataframe header."""
         if self.virtualDevice:
+            time.sleep(0.1)  # emulate the device frame period
             self.detectorEvents = 1000
-            self.timeIndex = (self.timeIndex + 1) % 65336
+            self.timeIndex = (self.timeIndex + 1) & 0xFFFF
             self.tempADC = 50000
         else:
+            read = self.device.read
+            endpointAddress = self.ep.bEndpointAddress
+            data = self.data
             while True:
                 try:
-                    self.data = self.device.read(
-                        self.ep.bEndpointAddress, self.ep.wMaxPacketSize, 100
-                    )
+                    # well above the 100 ms frame period: the loop no longer sleeps
+                    # before reading, so the header has to wait for the next frame
+                    nRead = read(endpointAddress, data, 1000)
+                    if nRead < _HEADER_STRUCT.size:
+                        return False
                     (
                         self.headerStart,
                         self.detectorEvents,
                         self.timeIndex,
                         self.tempADC,
-                    ) = unpack(">LHxxHHxxxx", self.data[0:16])
+                    ) = _HEADER_STRUCT.unpack_from(data, 0)
                 except Exception:
                     return False
                 if self.headerStart == 1515870810:
@@ -163,34 +222,65 @@ class HamamatsuDetector:
                     print(
                         f"Bad header start value {self.headerStart} - resyncing data frame"
                     )
-            self.headerData = self.data[16:]
+            # view, not a copy: consumed by processReadings before the next read
+            self.headerData = memoryview(data)[16:nRead]
 
-        # time overflow handling
-        if self.previousTimeIndex - self.timeIndex > 65000:
-            self.timeOverflows += 1
-        self.deviceTime = (65536 * self.timeOverflows + self.timeIndex) / 10.0
+        # time overflow handling: unsigned 16-bit difference absorbs wraparound
+        self.deviceTicks += (self.timeIndex - self.previousTimeIndex) & 0xFFFF
+        self.previousTimeIndex = self.timeIndex
+        self.deviceTime = self.deviceTicks / 10.0
         # temperature
         self.temperature = 188.686 - 0.00348 * self.tempADC
         return True
 
-    def processReadings(self) -> bool:
-        """Read the 12-bit channel data into self.channels."""
-        self.channels = np.zeros(1048, dtype=np.uint16)
+    def processReadings(self) -> Optional[bool]:
+        """
+        Read the channel data (little-endian 16-bit words) into self.channels.
+
+        Returns True on success and False on a read failure. Returns None if
+        the frame was dropped and the next processHeader() should resync.
+        """
         if self.virtualDevice:
             self.channels[:1000] = np.random.randint(0, 65336, 1000, dtype=np.uint16)
             return True
 
+        channels = self.channels
         try:
+            read = self.device.read
+            endpointAddress = self.ep.bEndpointAddress
             # first 24 channels from header remnant
-            self.channels[:24] = unpack("<" + "H" * 24, self.headerData)
+            channels[:24] = np.frombuffer(self.headerData, dtype="<u2", count=24)
             self.headerData = None
-            # remaining channels
-            for address in range(24, 1048, self.maxPacketSize16):
-                self.data = self.device.read(
-                    self.ep.bEndpointAddress, self.ep.wMaxPacketSize, 100
-                )
-                self.channels[address : address + self.maxPacketSize16] = unpack(
-                    "<" + "H" * self.maxPacketSize16, self.data
+            # remaining channels, in one transfer unless the device/driver caps its size
+            if not self.chunkedReads:
+                frameData = self.frameData
+                try:
+                    nRead = read(endpointAddress, frameData, 100)
+                except usb.core.USBTimeoutError:
+                    return False
+                except usb.core.USBError as e:
+                    if e.errno not in _TRANSFER_SIZE_ERRNOS:
+                        return False
+                    # part of the frame may already be consumed: drop it and
+                    # use packet-sized reads from the next frame on
+                    if self.verbose > 0:
+                        print("Large bulk read rejected - falling back to packet-sized reads")
+                    self.chunkedReads = True
+                    return None
+                else:
+                    if nRead != len(frameData):
+                        return False
+                    channels[24:] = np.frombuffer(frameData, dtype="<u2")
+                    return True
+            data = self.data
+            packetSize8 = self.maxPacketSize8
+            packetSize16 = self.maxPacketSize16
+            for address in range(24, 1048, packetSize16):
+                nRead = read(endpointAddress, data, 100)
+                if nRead != packetSize8:
+                    return False
+                channels[address : address + packetSize16] = np.frombuffer(
+                    data, dtype="<u2", count=packetSize16
                 )
         except Exception:
             return False
@@ -199,7 +289,7 @@ class HamamatsuDetector:
     def binChannels(self, binning: int = 16):
         """Bin raw channels into 4096-channel spectrum bins."""
         self.channelBinning = binning
-        self.binnedChannels = np.floor_divide(self.channels, self.channelBinning)
+        np.floor_divide(self.channels, self.channelBinning, out=self.binnedChannels)
 
 
 class HamamatsuController:
@@ -209,6 +299,7 @@ class HamamatsuController:
     Provides:
       - start(), stop(), reset()
       - get_spectrum() -> (spectrum, elapsed, cps, temperature, device_time)
+      - get_spectrum_view() -> (read-only spectrum, frame, elapsed, cps, temperature, device_time)
       - acquire_spectrum_for_duration()
       - start_periodic_logging() / stop_periodic_logging()
     """
@@ -233,24 +324,34 @@ class HamamatsuController:
 
         # Spectrum & timing
         self.spectrum = np.zeros(4096, dtype=np.uint32)
+        self._spectrum_view = self.spectrum.view()
+        self._spectrum_view.flags.writeable = False
+        self._frame_counter = 0  # bumped whenever self.spectrum changes
+        self._total_counts = 0
         self.elapsed_time = 0.0
         self._start_time = None
 
         # CPS estimation
         self.cps = 0.0
         self._cps_window = 3.0  # seconds
-        self._history = []  # list of (time, total_counts)
+        self._flush_interval = 0.05  # seconds between spectrum updates
+        self._history = deque()  # (time, total_counts), oldest first; acquisition thread only
+        self._reset_count = 0  # bumped by reset() so the acquisition thread drops _history
 
         # Telemetry
         self.temperature = float("nan")
         self.device_time = 0.0
 
-        # Logging
-        self._log_thread: Optional[threading.Thread] = None
-        self._log_stop_event = threading.Event()
+        # Logging (entries are snapshotted under _lock and written by the acquisition thread)
+        self._log_file: Optional[TextIO] = None
         self._log_filename: Optional[str] = None
         self._log_interval: Optional[float] = None
         self._log_total_time: Optional[float] = None
+        self._log_start = 0.0
+        self._log_prev = 0.0
+        self._log_next = 0.0
+        self._log_snapshot = np.zeros(4096, dtype=np.uint32)
+        self._log_lock = threading.Lock()  # serializes file writes with close
         self.last_delta_t: Optional[float] = None
 
     # --------------------------------------------------------
@@ -265,7 +366,7 @@ class HamamatsuController:
             print("Starting HamamatsuController...")
         self._stop_event.clear()
         self._running = True
-        self._start_time = time.time()
+        self._start_time = time.monotonic()
         self._thread = threading.Thread(target=self._acquisition_loop)
         self._thread.start()
 
@@ -294,6 +395,13 @@ class HamamatsuController:
 
     def _acquisition_loop(self):
         """Continuous acquisition loop with automatic device handling."""
+        history_reset_count = self._reset_count
+        # frames are binned into a local spectrum and flushed into
+        # self.spectrum every _flush_interval, so the lock is taken less often
+        local_spectrum = np.zeros(4096, dtype=np.uint32)
+        local_counts = 0
+        local_reset_count = self._reset_count
+        last_flush = time.monotonic()
         while not self._stop_event.is_set():
             # (Re)create detector
             self.detector = HamamatsuDetector(
@@ -308,57 +416,74 @@ class HamamatsuController:
                 time.sleep(2)
                 continue
 
-            looptime = 0.1
-            loop_step = 0.001
+            # binning by 16 (65536 raw values -> 4096 bins), fused into one shift-and-count pass
+            shift = 4
 
             if self.verbose:
                 print("Hamamatsu setup complete. Entering acquisition loop...")
 
             while not self._stop_event.is_set():
                 try:
-                    time.sleep(max(0.0, looptime))
-
+                    # paced by the device: reads block until a frame arrives or time out
                     if not self.detector.processHeader():
                         if self.verbose:
                             print("Header read failed — restarting.")
                         break
-                    if not self.detector.processReadings():
+                    readings = self.detector.processReadings()
+                    if readings is None:
+                        continue
+                    if not readings:
                         if self.verbose:
                             print("Channel read failed — restarting.")
                         break
 
-                    # Bin channels (protect against missing data)
-                    if hasattr(self.detector, "channels") and len(self.detector.channels) > 0:
-                        self.detector.binChannels(16)
-                        if not hasattr(self.detector, "binnedChannels"):
-                            if self.verbose:
-                                print("binChannels() failed — skipping this frame.")
-                            continue
-                    else:
-                        if self.verbose:
-                            print("No channel data — skipping this frame.")
+                    channels = self.detector.channels
+                    n = min(self.detector.detectorEvents, len(channels))
+                    # events binned before a reset() must not reach the zeroed spectrum
+                    if self._reset_count != local_reset_count:
+                        local_spectrum.fill(0)
+                        local_counts = 0
+                        local_reset_count = self._reset_count
+                    local_counts += _bin_and_accum(channels, n, local_spectrum, shift)
+
+                    now = time.monotonic()
+                    if now - last_flush < self._flush_interval:
                         continue
+                    last_flush = now
 
-                    counts = np.bincount(
-                        self.detector.binnedChannels[: self.detector.detectorEvents],
-                        minlength=4096,
-                    ).astype(np.uint32)
-
-                    now = time.time()
                     with self._lock:
-                        self.spectrum += counts
+                        if self._reset_count == local_reset_count:
+                            self.spectrum += local_spectrum
+                            self._total_counts += local_counts
+                        self._frame_counter += 1
+                        total_counts = self._total_counts
+                        reset_count = self._reset_count
                         self.elapsed_time = now - self._start_time
                         self.temperature = self.detector.temperature
                         self.device_time = self.detector.deviceTime
-
-                        total_counts = int(self.spectrum.sum())
-                        self._history.append((now, total_counts))
-                        self._history = [(t, c) for t, c in self._history if now - t <= self._cps_window]
-                        if len(self._history) > 1:
-                            dt = self._history[-1][0] - self._history[0][0]
-                            if dt > 0:
-                                dc = self._history[-1][1] - self._history[0][1]
-                                self.cps = dc / dt
+                        log_entry = None
+                        if self._log_file is not None and now >= self._log_next:
+                            log_entry = self._snapshot_log_entry(now)
+                    local_spectrum.fill(0)
+                    local_counts = 0
+                    if log_entry is not None:
+                        self._write_log_entry(*log_entry)
+
+                    # CPS window, computed outside the lock
+                    if reset_count != history_reset_count:
+                        self._history.clear()
+                        history_reset_count = reset_count
+                    self._history.append((now, total_counts))
+                    while now - self._history[0][0] > self._cps_window:
+                        self._history.popleft()
+                    if len(self._history) > 1:
+                        dt = self._history[-1][0] - self._history[0][0]
+                        if dt > 0:
+                            dc = self._history[-1][1] - self._history[0][1]
+                            with self._lock:
+                                # a reset() since this flush makes the rate stale
+                                if self._reset_count == reset_count:
+                                    self.cps = dc / dt
 
                 except Exception as e:
                     if self.verbose:
@@ -369,6 +494,13 @@ class HamamatsuController:
             if self.verbose:
                 print("Lost communication with detector, attempting restart...")
 
+        # flush counts still pending in the local spectrum
+        with self._lock:
+            if self._reset_count == local_reset_count:
+                self.spectrum += local_spectrum
+                self._total_counts += local_counts
+                self._frame_counter += 1
+
         if self.verbose:
             print("Acquisition loop exited cleanly.")
 
@@ -380,10 +512,12 @@ class HamamatsuController:
         """Reset cumulative spectrum, timer, CPS, and history."""
         with self._lock:
             self.spectrum[:] = 0
-            self._start_time = time.time()
+            self._frame_counter += 1
+            self._total_counts = 0
+            self._start_time = time.monotonic()
             self.elapsed_time = 0.0
             self.cps = 0.0
-            self._history.clear()
+            self._reset_count += 1
         if self.verbose:
             print("Spectrum reset.")
 
@@ -407,6 +541,30 @@ class HamamatsuController:
             dev_time = self.device_time
         return spec, elapsed, cps, temp, dev_time
 
+    def get_spectrum_view(self) -> Tuple[np.ndarray, int, float, float, float, float]:
+        """
+        Return a read-only view of the live spectrum, a frame counter,
+        elapsed time, CPS, temperature, and device time.
+
+        The view is not a snapshot; it changes as frames arrive. Compare the
+        frame counter with a previous call to detect new data, and use
+        get_spectrum() when a consistent copy is needed.
+
+        Automatically starts acquisition if not already running.
+        """
+        if not self._running:
+            if self.verbose:
+                print("Acquisition not running — starting automatically.")
+            self.start()
+            time.sleep(0.5)
+        with self._lock:
+            frame = self._frame_counter
+            elapsed = self.elapsed_time
+            cps = self.cps
+            temp = self.temperature
+            dev_time = self.device_time
+        return self._spectrum_view, frame, elapsed, cps, temp, dev_time
+
     # --------------------------------------------------------
     # TIMED ACQUISITION
     # --------------------------------------------------------
@@ -430,8 +588,8 @@ class HamamatsuController:
         if not self._running:
             self.start()
         self.reset()
-        start = time.time()
-        while time.time() - start < duration and self._running:
+        start = time.monotonic()
+        while time.monotonic() - start < duration and self._running:
             time.sleep(0.1)
         spec, elapsed, _, _, _ = self.get_spectrum()
         if filename:
@@ -457,7 +615,7 @@ class HamamatsuController:
         total_time : float
             Total time to log for. If 0, log until stopped.
         """
-        if self._log_thread and self._log_thread.is_alive():
+        if self._log_file is not None:
             if self.verbose:
                 print("Logging already active.")
             return
@@ -471,47 +629,68 @@ class HamamatsuController:
             ext = ".csv"
         filename = f"{root}_{dt_str}{ext}"
 
-        self._log_filename = filename
-        self._log_interval = interval
-        self._log_total_time = total_time
-        self._log_stop_event.clear()
-        self.last_delta_t = 0.0
+        # line-buffered, kept open for the whole logging session
+        f = open(filename, "w", buffering=1)
+        f.write(_CSV_HEADER)
 
-        with open(filename, "w") as f:
-            f.write("delta_t," + ",".join([f"ch{i}" for i in range(4096)]) + "\n")
-
-        self._log_thread = threading.Thread(target=self._logging_loop)
-        self._log_thread.start()
+        now = time.monotonic()
+        with self._lock:
+            self._log_filename = filename
+            self._log_interval = interval
+            self._log_total_time = total_time
+            self._log_start = now
+            self._log_prev = now
+            self._log_next = now
+            self.last_delta_t = 0.0
+            self._log_file = f
+
+        # entries are written by the acquisition thread
+        if not self._running:
+            self.start()
         if self.verbose:
             dur = "indefinitely" if total_time == 0 else f"for {total_time}s"
             print(f"Periodic logging started ({interval}s interval, {dur}) -> {filename}")
 
-    def _logging_loop(self):
-        prev_time = time.time()
-        start_time = prev_time
-        while not self._log_stop_event.is_set():
-            now = time.time()
-            self.last_delta_t = now - prev_time
-            prev_time = now
-
-            spectrum, _, _, _, _ = self.get_spectrum()
-            line = f"{self.last_delta_t:.3f}," + ",".join(map(str, spectrum)) + "\n"
+    def _snapshot_log_entry(self, now: float):
+        """Copy the spectrum for the next log entry. Called with self._lock held."""
+        np.copyto(self._log_snapshot, self.spectrum)
+        self.last_delta_t = now - self._log_prev
+        self._log_prev = now
+        self._log_next = now + self._log_interval
+        finished = self._log_total_time > 0 and (now - self._log_start) >= self._log_total_time
+        return self._log_file, self.last_delta_t, finished
+
+    def _write_log_entry(self, f: TextIO, delta_t: float, finished: bool):
+        """Append the snapshot to the log file, without holding self._lock."""
+        with self._log_lock:
+            if f.closed:  # stop_periodic_logging() ran after the snapshot
+                return
             try:
-                with open(self._log_filename, "a") as f:
-                    f.write(line)
+                f.write(f"{delta_t:.3f},")
+                self._log_snapshot.tofile(f, sep=",")
+                f.write("\n")
             except Exception as e:
                 print(f"Error writing log file: {e}")
 
-            if self._log_total_time > 0 and (now - start_time) >= self._log_total_time:
-                break
-            time.sleep(self._log_interval)
-        if self.verbose:
-            print("Logging loop ended.")
+            if finished:
+                with self._lock:
+                    if self._log_file is f:
+                        self._log_file = None
+                f.close()
+                if self.verbose:
+                    print("Periodic logging finished.")
+
+    def is_logging(self) -> bool:
+        """Return True while periodic logging is active."""
+        return self._log_file is not None
 
     def stop_periodic_logging(self):
         """Stop periodic logging if running."""
-        if self._log_thread and self._log_thread.is_alive():
-            self._log_stop_event.set()
-            self._log_thread.join(timeout=2.0)
+        with self._lock:
+            f = self._log_file
+            self._log_file = None
+        if f is not None:
+            with self._log_lock:
+                f.close()
             if self.verbose:
                 print("Periodic logging stopped.")
@@ -79,7 +79,7 @@ def example_periodic_logging():
     plt.tight_layout()
 
     try:
-        while ctrl._log_thread and ctrl._log_thread.is_alive():
+        while ctrl.is_logging():
             spectrum, elapsed, cps, temp, _ = ctrl.get_spectrum()
             line.set_ydata(spectrum)
             ax.relim()
@@ -78,9 +78,12 @@ class HamamatsuGUI:
         self.ax.set_title("Hamamatsu Live Spectrum")
         self.ax.set_xlabel("Channel")
         self.ax.set_ylabel("Counts")
-        self.line, = self.ax.plot(np.arange(4096), np.zeros(4096), color="blue")
+        # the line is blitted over a cached background, see update_plot()
+        self.line, = self.ax.plot(np.arange(4096), np.zeros(4096), color="blue", animated=True)
         self.canvas = FigureCanvasTkAgg(fig, master=self.root)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self._background = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
 
         self.status = tk.StringVar(value="Ready")
         ttk.Label(self.root, textvariable=self.status, relief=tk.SUNKEN, anchor="w").pack(side=tk.BOTTOM, fill=tk.X)
@@ -165,9 +168,13 @@ class HamamatsuGUI:
     # --------------------------------------------------------
 
     def _update_loop(self):
+        last_frame = None
         while self.running and not self._shutdown:
-            spectrum, elapsed, cps, temp, dev_time = self.controller.get_spectrum()
-            self.update_plot(spectrum)
+            spectrum, frame, elapsed, cps, temp, dev_time = self.controller.get_spectrum_view()
+            if frame != last_frame:
+                # all drawing and blitting happens on the Tk thread
+                self.root.after(0, self.update_plot, spectrum)
+                last_frame = frame
             dt = self.controller.last_delta_t
             if dt:
                 self.status.set(
@@ -180,11 +187,24 @@ class HamamatsuGUI:
             time.sleep(0.25)
         print("Update thread exited cleanly.")
 
+    def _on_draw(self, event):
+        """Cache the static background after a full redraw and paint the line on top."""
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
     def update_plot(self, spectrum):
         self.line.set_ydata(spectrum)
-        self.ax.relim()
-        self.ax.autoscale_view(True, True, True)
-        self.canvas.draw_idle()
+        ymax = self.ax.get_ylim()[1]
+        peak = float(np.max(spectrum))
+        top = max(peak, 1.0) * 1.1
+        if self._background is None or peak > ymax or top < 0.5 * ymax:
+            # y-range changes: full redraw, which refreshes the cached background
+            self.ax.set_ylim(0, top)
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
 
     # --------------------------------------------------------
     # SHUTDOWN
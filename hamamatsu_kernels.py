@@ -0,0 +1,72 @@
+"""
+Hamamatsu Spectrum Kernels
+==========================
+
+Per-frame binning and accumulation kernels used by the HamamatsuController.
+
+Each kernel is taken from the first available source:
+ - `_hamamatsu_kernels`, an ahead-of-time compiled extension (no JIT warmup)
+ - numba JIT compilation, if numba is installed
+ - a pure numpy fallback
+
+Build the ahead-of-time extension next to this file (requires numba):
+    python hamamatsu_kernels.py
+"""
+
+import os
+
+import numpy as np
+
+
+def _accumulate_loop(binned, n, spectrum):
+    """Add one count per event in binned[:n] into spectrum; return the count added."""
+    for i in range(n):
+        spectrum[binned[i]] += 1
+    return n
+
+
+def _bin_and_accum_loop(channels, n, spectrum, shift):
+    """Bin channels[:n] by 2**shift and add them into spectrum; return the count added."""
+    for i in range(n):
+        spectrum[channels[i] >> shift] += 1
+    return n
+
+
+try:
+    from _hamamatsu_kernels import accumulate, bin_and_accum
+except ImportError:
+    try:
+        from numba import njit
+    except ImportError:  # numba is optional; fall back to numpy
+        njit = None
+
+    if njit is not None:
+        accumulate = njit(cache=True)(_accumulate_loop)
+        bin_and_accum = njit(cache=True, boundscheck=False)(_bin_and_accum_loop)
+
+    else:
+
+        def accumulate(binned, n, spectrum):
+            """Add one count per event in binned[:n] into spectrum; return the count added."""
+            np.add.at(spectrum, binned[:n], 1)
+            return n
+
+        def bin_and_accum(channels, n, spectrum, shift):
+            """Bin channels[:n] by 2**shift and add them into spectrum; return the count added."""
+            np.add.at(spectrum, channels[:n] >> shift, 1)
+            return n
+
+
+def build():
+    """Compile the `_hamamatsu_kernels` extension module next to this file."""
+    from numba.pycc import CC
+
+    cc = CC("_hamamatsu_kernels")
+    cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+    cc.export("accumulate", "i8(u2[:], i8, u4[:])")(_accumulate_loop)
+    cc.export("bin_and_accum", "i8(u2[:], i8, u4[:], i8)")(_bin_and_accum_loop)
+    cc.compile()
+
+
+if __name__ == "__main__":
+    build()